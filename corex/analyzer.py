@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from string import Template
 
 from loguru import logger
 
@@ -6,10 +8,18 @@ from .config import PROMPT_TEMPLATES_DIR
 from .llms import LLM
 
 
+@lru_cache(maxsize=None)
+def _load_template(name: str) -> str:
+    """读取提示词模板，每个模板在进程内只读取一次"""
+    return (PROMPT_TEMPLATES_DIR / name).read_text(encoding="utf-8")
+
+
 class Analyzer(ABC):
     def __init__(self, llms: LLM):
         self.llms = llms
         self.prompt = ""
+        self.prefix = ""
+        self.template = Template("")
         self.comments = ""
         self.context = ""
 
@@ -17,10 +27,46 @@ class Analyzer(ABC):
     def load_prompt_template(self):
         raise NotImplementedError()
 
+    def split_prompt_template(self):
+        """
+        以 {{comment}} 为界将模板拆分为静态前缀与动态后缀
+
+        前缀在所有请求间保持字节一致，以命中服务端的前缀缓存（prompt caching）；
+        后缀预编译为 string.Template，填充时一次替换完成
+        """
+        self.prefix, _, suffix = self.prompt.partition("{{comment}}")
+        suffix = suffix.replace("$", "$$").replace("{{context}}", "${context}")
+        self.template = Template("${comment}" + suffix)
+
+    @abstractmethod
+    def fill_prompt(self, comment: str, context: str = "") -> str:
+        raise NotImplementedError()
+
     @abstractmethod
     def analyze(self):
         raise NotImplementedError()
 
+    def analyze_batch(
+        self, comments: list[str], contexts: list[str] | None = None
+    ) -> list[str]:
+        """
+        并发分析多条注释
+
+        Args:
+            comments: 注释列表
+            contexts: 与 comments 一一对应的上下文，缺省时统一使用 self.context
+
+        Returns:
+            与 comments 顺序一致的分析结果列表
+        """
+        if contexts is None:
+            contexts = [self.context] * len(comments)
+        prompts = [
+            self.fill_prompt(comment, context)
+            for comment, context in zip(comments, contexts)
+        ]
+        return self.llms.generate_batch(prompts)
+
 
 class AnalyzerWithContext(Analyzer):
     def __init__(self, llms: LLM):
@@ -29,14 +75,14 @@ class AnalyzerWithContext(Analyzer):
         self.load_prompt_template()
 
     def load_prompt_template(self):
-        prompt_path = PROMPT_TEMPLATES_DIR / "analysis_comment_with_context.md"
-        with open(prompt_path, "r") as f:
-            self.prompt = f.read()
+        self.prompt = _load_template("analysis_comment_with_context.md")
+        self.split_prompt_template()
+
+    def fill_prompt(self, comment: str, context: str = "") -> str:
+        return self.prefix + self.template.substitute(comment=comment, context=context)
 
     def analyze(self):
-        prompt_filled = self.prompt.replace("{{comment}}", self.comments).replace(
-            "{{context}}", self.context
-        )
+        prompt_filled = self.fill_prompt(self.comments, self.context)
         response = self.llms.generate(prompt_filled)
         return response
 
@@ -47,12 +93,14 @@ class AnalyzerWithoutContext(Analyzer):
         self.load_prompt_template()
 
     def load_prompt_template(self):
-        prompt_path = PROMPT_TEMPLATES_DIR / "analysis_comment_without_context.md"
-        with open(prompt_path, "r") as f:
-            self.prompt = f.read()
+        self.prompt = _load_template("analysis_comment_without_context.md")
+        self.split_prompt_template()
+
+    def fill_prompt(self, comment: str, context: str = "") -> str:
+        return self.prefix + self.template.substitute(comment=comment)
 
     def analyze(self):
-        prompt_filled = self.prompt.replace("{{Comment}}", self.comments)
+        prompt_filled = self.fill_prompt(self.comments)
         # logger.info(f"Filled Prompt:\n{prompt_filled}")
         response = self.llms.generate(prompt_filled)
         return response
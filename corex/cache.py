@@ -0,0 +1,77 @@
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable
+
+import orjson
+
+from .config import CACHE_DIR
+
+
+class ResponseCache:
+    """
+    LLM 回复缓存 - 以 sha1(模型名 + 模型配置 + prompt) 为键
+
+    有上限的内存 LRU 在前，SQLite 持久化在后，跨进程运行时复用历史回复。
+    只做精确匹配：注释间细微的差别（例如一个拼写错误）正是要检测的内容，
+    相似度匹配会把有错的注释命中到无错注释的结果上。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_config: dict[str, Any] | None = None,
+        cache_dir: Path = CACHE_DIR,
+        max_size: int = 50000,
+    ):
+        self.model_name = model_name
+        # temperature、max_tokens、base_url 等配置改变后不再命中旧回复
+        self.config_hash = hashlib.sha1(
+            orjson.dumps(model_config or {}, option=orjson.OPT_SORT_KEYS, default=str)
+        ).hexdigest()
+        self.memory: OrderedDict[str, str] = OrderedDict()
+        self.max_size = max_size
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(cache_dir / "responses.sqlite3")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT)"
+        )
+
+    def _key(self, prompt: str) -> str:
+        return hashlib.sha1(
+            f"{self.model_name}\0{self.config_hash}\0{prompt}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, prompt: str) -> str | None:
+        key = self._key(prompt)
+        response = self.memory.get(key)
+        if response is None:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response = row[0]
+        self._remember(key, response)
+        return response
+
+    def set(self, prompt: str, response: str) -> None:
+        self.set_many([(prompt, response)])
+
+    def set_many(self, items: Iterable[tuple[str, str]]) -> None:
+        """批量写入回复，所有记录在同一个事务中提交"""
+        rows = [(self._key(prompt), response) for prompt, response in items]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", rows
+            )
+        for key, response in rows:
+            self._remember(key, response)
+
+    def _remember(self, key: str, response: str) -> None:
+        """更新内存 LRU，超出上限时淘汰最久未使用的记录"""
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
@@ -5,9 +5,15 @@ LLM_CONFIG_DIR = ROOT_DIR / "llm_config"
 MODEL_CONFIG_PATH = LLM_CONFIG_DIR / "model_config.yaml"
 LLM_KEYS_PATH = LLM_CONFIG_DIR / "llm_keys.yaml"
 PROMPT_TEMPLATES_DIR = ROOT_DIR / "prompts"
+MAX_CONCURRENCY = 16
+CACHE_DIR = Path.home() / ".cache" / "corex"
 LANGUAGE_SUFFIX_MAP = {
     "python": [".py"],
     "c/c++": [".cpp", ".c", ".h", ".hpp", ".cc", ".cxx"],
     "cuda": [".cu", ".cuh"],
     "objective-c": [".m", ".mm"],
 }
+LANGUAGE_SUFFIX_SETS = {
+    language: frozenset(suffix) for language, suffix in LANGUAGE_SUFFIX_MAP.items()
+}
+IGNORED_DIRS = frozenset({".git", "__pycache__", "node_modules"})
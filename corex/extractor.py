@@ -1,12 +1,45 @@
-import json
+import os
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Iterator, List
 
+import orjson
 from loguru import logger
-from tree_sitter_languages import get_parser
+from tree_sitter_languages import get_language, get_parser
 
-from .config import LANGUAGE_SUFFIX_MAP
+from .config import IGNORED_DIRS, LANGUAGE_SUFFIX_SETS
+
+COMMENT_QUERY = "(comment) @comment"
+
+# docstring：模块、类或函数的第一条语句（可以有注释在前）为字符串字面量
+DOCSTRING_QUERY = {
+    "python": """
+    (module . (comment)* . (expression_statement . (string) @docstring))
+    (function_definition
+      body: (block . (comment)* . (expression_statement . (string) @docstring)))
+    (class_definition
+      body: (block . (comment)* . (expression_statement . (string) @docstring)))
+    """,
+}
+
+CONTEXT_NODE_TYPES = ("function_definition", "class_definition")
+
+
+@lru_cache(maxsize=8)
+def _get_parser(language: str):
+    """加载语言库并创建 parser，每种语言在进程内只初始化一次"""
+    return get_parser(language)
+
+
+@lru_cache(maxsize=8)
+def _get_query(language: str):
+    """编译注释查询，每种语言在进程内只编译一次"""
+    return get_language(language).query(
+        COMMENT_QUERY + DOCSTRING_QUERY.get(language, "")
+    )
 
 
 class Extractor(ABC):
@@ -14,9 +47,12 @@ class Extractor(ABC):
         self.language = language
 
     @abstractmethod
-    def parse_file(self, file_path: Path) -> List[dict[str, Any]]:
+    def iter_files(self, file_path: Path) -> Iterator[dict[str, Any]]:
         raise NotImplementedError()
 
+    def parse_file(self, file_path: Path) -> List[dict[str, Any]]:
+        return list(self.iter_files(file_path))
+
 
 class KeywordExtractor(Extractor):
     """关键词提取器 - 占位类"""
@@ -24,116 +60,106 @@ class KeywordExtractor(Extractor):
     def __init__(self, language: str):
         super().__init__(language=language)
 
-    def parse_file(self, file_path: Path) -> List[dict[str, Any]]:  # type: ignore
+    def iter_files(self, file_path: Path) -> Iterator[dict[str, Any]]:  # type: ignore
         pass
 
 
 class CommentExtractor(Extractor):
     """多语言注释提取器"""
 
-    def __init__(self, language: str):
+    def __init__(self, language: str, include_context: bool = True):
         super().__init__(language=language)
-        self.parser = get_parser(self.language)
+        self.include_context = include_context
+        self.parser = _get_parser(self.language)
+        self.query = _get_query(self.language)
         self.source_code = b""
-        self.source_lines = []
+        self._definition_cache: dict[int, dict[str, Any]] = {}
+        self._context_cache: dict[int, dict[str, Any]] = {}
 
-    def parse_file(self, file_path: Path) -> List[dict[str, Any]]:
+    def iter_files(self, file_path: Path) -> Iterator[dict[str, Any]]:
         """
-        解析指定语言的文件并提取注释信息
+        逐个文件解析指定语言的文件并提取注释信息
 
         Args:
-            file_path: 文件路径
+            file_path: 文件或目录路径
 
-        Returns:
-            包含注释信息的字典
+        Yields:
+            每个文件的注释信息字典
         """
         file_path = Path(file_path)
-        if file_path.is_dir():
-            suffix = LANGUAGE_SUFFIX_MAP.get(self.language, [])
-            if not suffix:
-                raise ValueError(f"Unsupported language: {self.language}")
-
-            file_list = [p for ext in suffix for p in file_path.rglob(f"*{ext}")]
-        else:
-            file_list = [file_path]
-
-        all_comments = []
-        for file in file_list:
-            self.source_code = file.read_bytes()
-            self.source_lines = self.source_code.decode("utf-8").split("\n")
-
-            tree = self.parser.parse(self.source_code)
-            root_node = tree.root_node
-
-            comments = []
-            self._extract_comments(root_node, comments)
-            dic = {
-                "file": str(file),
-                "total_comments": len(comments),
-                "comments": comments,
-            }
-            all_comments.append(dic)
-        return all_comments
-
-    def _extract_comments(self, node, comments: list) -> None:
+        if not file_path.is_dir():
+            yield self._parse_one_file(file_path)
+            return
+
+        suffix_set = LANGUAGE_SUFFIX_SETS.get(self.language)
+        if not suffix_set:
+            raise ValueError(f"Unsupported language: {self.language}")
+
+        # 单次遍历目录树，按后缀集合匹配，跳过 .git 等无关目录
+        file_list = []
+        for root, dirs, names in os.walk(file_path):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            file_list.extend(
+                Path(root) / name
+                for name in names
+                if os.path.splitext(name)[1] in suffix_set
+            )
+
+        # 各文件相互独立，按文件分发到多进程并行解析；
+        # Executor.map 会一次性提交全部任务，解析远快于下游的大模型请求，
+        # 结果会堆积在父进程中，因此只保留 2×进程数 个尚未被消费的任务
+        max_workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(self.language, self.include_context),
+        ) as executor:
+            pending: deque[Future[dict[str, Any]]] = deque()
+            for file in file_list:
+                pending.append(executor.submit(_parse_one, file))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _parse_one_file(self, file: Path) -> dict[str, Any]:
         """
-        递归提取所有注释节点
+        解析单个文件并提取注释信息
 
         Args:
-            node: tree-sitter 节点
-            comments: 注释列表
+            file: 文件路径
+
+        Returns:
+            包含注释信息的字典
         """
-        # 提取 # 注释
-        if node.type == "comment":
-            comment_info = self._extract_comment_info(node)
-            comments.append(comment_info)
-
-        # 提取 docstring（字符串字面量作为表达式语句）
-        elif node.type == "expression_statement":
-            if node.children and node.children[0].type == "string":
-                string_node = node.children[0]
-                # 判断是否为 docstring
-                if self._is_docstring(node):
-                    comment_info = self._extract_docstring_info(string_node, node)
-                    comments.append(comment_info)
-
-        # 递归处理子节点
-        for child in node.children:
-            self._extract_comments(child, comments)
-
-    def _is_docstring(self, expr_stmt_node) -> bool:
+        self.source_code = file.read_bytes()
+        self._definition_cache = {}
+        self._context_cache = {}
+
+        tree = self.parser.parse(self.source_code)
+        root_node = tree.root_node
+
+        comments = []
+        self._extract_comments(root_node, comments)
+        return {
+            "file": str(file),
+            "total_comments": len(comments),
+            "comments": comments,
+        }
+
+    def _extract_comments(self, root_node, comments: list) -> None:
         """
-        判断表达式语句是否为 docstring
+        通过 tree-sitter Query 一次性匹配所有注释与 docstring 节点
 
-        Docstring 通常是模块、类或函数的第一条语句
+        Args:
+            root_node: tree-sitter 根节点
+            comments: 注释列表
         """
-        parent = expr_stmt_node.parent
-        if parent is None:
-            return False
-
-        # 模块级 docstring
-        if parent.type == "module":
-            # 检查是否为第一个非注释子节点
-            for child in parent.children:
-                if child.type == "comment":
-                    continue
-                return child == expr_stmt_node
-
-        # 函数或类的 docstring
-        # 结构: function_definition/class_definition -> block -> expression_statement
-        if parent.type == "block":
-            # 检查 block 的父节点是否为函数或类定义
-            grandparent = parent.parent
-            if grandparent and grandparent.type in (
-                "function_definition",
-                "class_definition",
-            ):
-                # 检查是否为 block 的第一个非注释子节点
-                for child in parent.children:
-                    if child.type == "comment":
-                        continue
-                    return child == expr_stmt_node
-        return False
+        for node, capture_name in self.query.captures(root_node):
+            if capture_name == "comment":
+                comments.append(self._extract_comment_info(node))
+            else:
+                comments.append(self._extract_docstring_info(node, node.parent))
 
     def _extract_comment_info(self, node) -> dict[str, Any]:
         """
@@ -147,10 +173,10 @@ class CommentExtractor(Extractor):
         """
         start_line = node.start_point[0] + 1  # tree-sitter 行号从 0 开始
         end_line = node.end_point[0] + 1
-        comment_text = node.text.decode("utf-8")
+        comment_text = self._node_text(node)
 
         # 查找所在的函数或类
-        context = self._find_context(node)
+        context = self._find_context(node) if self.include_context else None
 
         return {
             "type": "comment",
@@ -173,10 +199,10 @@ class CommentExtractor(Extractor):
         """
         start_line = string_node.start_point[0] + 1
         end_line = string_node.end_point[0] + 1
-        docstring_text = string_node.text.decode("utf-8")
+        docstring_text = self._node_text(string_node)
 
         # 查找所在的函数或类
-        context = self._find_context(expr_stmt_node)
+        context = self._find_context(expr_stmt_node) if self.include_context else None
 
         return {
             "type": "docstring",
@@ -196,27 +222,52 @@ class CommentExtractor(Extractor):
         Returns:
             上下文信息字典
         """
+        # 最内层的函数或类定义
         current = node.parent
-        context_stack = []
+        while current is not None and current.type not in CONTEXT_NODE_TYPES:
+            current = current.parent
+
+        if current is None:
+            return {"type": "module", "name": None}
+
+        # 同一函数/类内的注释共享同一个上下文
+        if current.id in self._context_cache:
+            return self._context_cache[current.id]
 
+        leaf_id = current.id
+        context_stack = []
         while current is not None:
-            if current.type == "function_definition":
-                func_info = self._extract_function_info(current)
-                context_stack.append(func_info)
-            elif current.type == "class_definition":
-                class_info = self._extract_class_info(current)
-                context_stack.append(class_info)
+            if current.type in CONTEXT_NODE_TYPES:
+                context_stack.append(self._get_definition_info(current))
             current = current.parent
 
         # 反转堆栈，使得最外层的上下文在前
         context_stack.reverse()
 
-        if not context_stack:
-            return {"type": "module", "name": None}
-
-        return (
+        context = (
             context_stack[-1] if len(context_stack) == 1 else {"chain": context_stack}
         )
+        self._context_cache[leaf_id] = context
+        return context
+
+    def _get_definition_info(self, node) -> dict[str, Any]:
+        """
+        获取函数或类信息，每个定义节点只提取一次
+
+        Args:
+            node: function_definition 或 class_definition 节点
+
+        Returns:
+            函数或类信息字典
+        """
+        info = self._definition_cache.get(node.id)
+        if info is None:
+            if node.type == "function_definition":
+                info = self._extract_function_info(node)
+            else:
+                info = self._extract_class_info(node)
+            self._definition_cache[node.id] = info
+        return info
 
     def _extract_function_info(self, func_node) -> dict[str, Any]:
         """
@@ -233,7 +284,7 @@ class CommentExtractor(Extractor):
 
         for child in func_node.children:
             if child.type == "identifier":
-                func_name = child.text.decode("utf-8")
+                func_name = self._node_text(child)
             elif child.type == "parameters":
                 params = self._extract_parameters(child)
 
@@ -241,7 +292,7 @@ class CommentExtractor(Extractor):
         end_line = func_node.end_point[0] + 1
 
         # 提取函数代码
-        func_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        func_code = self._extract_lines(func_node)
 
         return {
             "type": "function",
@@ -266,14 +317,14 @@ class CommentExtractor(Extractor):
 
         for child in class_node.children:
             if child.type == "identifier":
-                class_name = child.text.decode("utf-8")
+                class_name = self._node_text(child)
                 break
 
         start_line = class_node.start_point[0] + 1
         end_line = class_node.end_point[0] + 1
 
         # 提取类代码
-        class_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        class_code = self._extract_lines(class_node)
 
         return {
             "type": "class",
@@ -283,6 +334,34 @@ class CommentExtractor(Extractor):
             "code": class_code,
         }
 
+    def _extract_lines(self, node) -> str:
+        """
+        按字节偏移截取节点所跨越的完整行（包含首行缩进）
+
+        Args:
+            node: tree-sitter 节点
+
+        Returns:
+            节点所在行的源代码
+        """
+        start = self.source_code.rfind(b"\n", 0, node.start_byte) + 1
+        end = self.source_code.find(b"\n", node.end_byte)
+        if end == -1:
+            end = len(self.source_code)
+        return self.source_code[start:end].decode("utf-8")
+
+    def _node_text(self, node) -> str:
+        """
+        按字节偏移从源代码中截取节点文本，省去 node.text 的额外拷贝
+
+        Args:
+            node: tree-sitter 节点
+
+        Returns:
+            节点文本
+        """
+        return self.source_code[node.start_byte : node.end_byte].decode("utf-8")
+
     def _extract_parameters(self, params_node) -> list[str]:
         """
         提取函数参数
@@ -296,24 +375,40 @@ class CommentExtractor(Extractor):
         params = []
         for child in params_node.children:
             if child.type == "identifier":
-                params.append(child.text.decode("utf-8"))
+                params.append(self._node_text(child))
             elif child.type == "typed_parameter":
                 for subchild in child.children:
                     if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
+                        params.append(self._node_text(subchild))
                         break
             elif child.type == "default_parameter":
                 for subchild in child.children:
                     if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
+                        params.append(self._node_text(subchild))
                         break
         return params
 
 
+# 工作进程内的提取器，由进程池 initializer 创建，每个进程只初始化一次
+_worker_extractor: CommentExtractor | None = None
+
+
+def _init_worker(language: str, include_context: bool) -> None:
+    """进程池 initializer：预加载 parser 与查询"""
+    global _worker_extractor
+    _worker_extractor = CommentExtractor(language, include_context=include_context)
+
+
+def _parse_one(file_path: Path) -> dict[str, Any]:
+    """进程池工作函数：解析单个文件"""
+    assert _worker_extractor is not None
+    return _worker_extractor._parse_one_file(file_path)
+
+
 # python -m corex.extractor
 if __name__ == "__main__":
     extractor = CommentExtractor(language="cpp")
     result = extractor.parse_file(
         Path("/home/haifeng/Science/CoRex/experiments/datasets/cpp_comments.cpp")
     )
-    logger.info(json.dumps(result, indent=4, ensure_ascii=False))
+    logger.info(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode("utf-8"))
@@ -1,44 +1,127 @@
+import asyncio
+
+import httpx
 import yaml
 from langchain_openai import ChatOpenAI
 from loguru import logger
 from pydantic import SecretStr
 
-from .config import LLM_KEYS_PATH, MODEL_CONFIG_PATH
+from .cache import ResponseCache
+from .config import LLM_KEYS_PATH, MAX_CONCURRENCY, MODEL_CONFIG_PATH
 
 
 class LLM:
     def __init__(
         self,
         model_name: str = "deepseek-chat",
+        use_cache: bool = False,
     ):
-        with open(LLM_KEYS_PATH, "r", encoding="utf-8") as f:
-            llm_keys = yaml.safe_load(f)
+        llm_keys = yaml.safe_load(LLM_KEYS_PATH.read_bytes())
         api_key = llm_keys.get(model_name, {})
         if not api_key:
             raise ValueError("API key is required. ")
-        with open(MODEL_CONFIG_PATH, "r", encoding="utf-8") as f:
-            model_configs = yaml.safe_load(f)
+        model_configs = yaml.safe_load(MODEL_CONFIG_PATH.read_bytes())
+        model_config = model_configs.get(model_name, {})
 
         self.model_name = model_name
+        # 缓存需显式开启：采样模型（temperature > 0）开启后重复运行只会回放旧回复
+        self.cache = ResponseCache(model_name, model_config) if use_cache else None
+        # 所有批次复用同一个事件循环：异步 HTTP 连接池绑定在事件循环上，
+        # 每批 asyncio.run 新建循环会让池中的 keep-alive 连接失效
+        self.loop = asyncio.new_event_loop()
+        # 连接池大小与并发数匹配，keep-alive 连接在整个运行中复用，避免重复握手
+        limits = httpx.Limits(
+            max_connections=MAX_CONCURRENCY * 4,
+            max_keepalive_connections=MAX_CONCURRENCY * 2,
+        )
+        self.http_client = httpx.Client(limits=limits, http2=True, timeout=60)
+        self.http_async_client = httpx.AsyncClient(
+            limits=limits, http2=True, timeout=60
+        )
         try:
             self.llm = ChatOpenAI(
                 model=model_name,
                 api_key=SecretStr(api_key),
-                **model_configs.get(model_name, {}),
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                **model_config,
             )
             logger.success(f"Initialized LLM with model: {model_name}")
         except Exception as e:
             raise Exception(f"Failed to initialize LLM: {e!s}") from e
 
     def generate(self, prompt: str) -> str:
+        if self.cache is not None and (cached := self.cache.get(prompt)) is not None:
+            return cached
         try:
             response = self.llm.invoke(prompt)
             content = response.content
-            if isinstance(content, str):
-                return content
-            return str(content)
+            if not isinstance(content, str):
+                content = str(content)
+        except Exception as e:
+            raise Exception(f"Failed to generate content: {e!s}") from e
+        if self.cache is not None:
+            self.cache.set(prompt, content)
+        return content
+
+    async def agenerate(self, prompt: str) -> str:
+        # 不在协程内读写缓存：SQLite 是同步 I/O，会阻塞事件循环上的其他请求，
+        # 缓存由 generate_batch 在事件循环外统一查询与写入
+        try:
+            response = await self.llm.ainvoke(prompt)
+            content = response.content
+            if not isinstance(content, str):
+                content = str(content)
         except Exception as e:
             raise Exception(f"Failed to generate content: {e!s}") from e
+        return content
+
+    def generate_batch(
+        self, prompts: list[str], max_concurrency: int = MAX_CONCURRENCY
+    ) -> list[str]:
+        """
+        并发生成多个 prompt 的回复，最多同时发出 max_concurrency 个请求
+
+        Args:
+            prompts: prompt 列表
+            max_concurrency: 最大并发请求数
+
+        Returns:
+            与 prompts 顺序一致的回复列表
+        """
+
+        async def _gather(pending: list[str]) -> list[str]:
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def _generate(prompt: str) -> str:
+                async with semaphore:
+                    return await self.agenerate(prompt)
+
+            return await asyncio.gather(*(_generate(prompt) for prompt in pending))
+
+        # 相同的 prompt 只请求一次；缓存在请求前一次性查询，未命中的才发出请求
+        unique_prompts = list(dict.fromkeys(prompts))
+        response_map: dict[str, str] = {}
+        if self.cache is not None:
+            for prompt in unique_prompts:
+                if (cached := self.cache.get(prompt)) is not None:
+                    response_map[prompt] = cached
+
+        pending = [prompt for prompt in unique_prompts if prompt not in response_map]
+        if pending:
+            responses = self.loop.run_until_complete(_gather(pending))
+            response_map.update(zip(pending, responses))
+            # 整批回复在一个事务中写入
+            if self.cache is not None:
+                self.cache.set_many(zip(pending, responses))
+        return [response_map[prompt] for prompt in prompts]
+
+    def close(self) -> None:
+        """关闭 HTTP 客户端与事件循环，释放连接池中的连接"""
+        # 异步客户端需要在创建其连接的事件循环上关闭
+        self.loop.run_until_complete(self.http_async_client.aclose())
+        self.http_client.close()
+        self.loop.close()
 
     def __repr__(self) -> str:
         """Return string representation of the agent."""
@@ -1,4 +1,6 @@
+import re
 from pathlib import Path
+from typing import Any
 
 import typer
 from loguru import logger
@@ -7,6 +9,49 @@ from .analyzer import Analyzer, AnalyzerWithContext, AnalyzerWithoutContext
 from .extractor import CommentExtractor, Extractor, KeywordExtractor
 from .llms import LLM
 
+# 注释两端的标记字符：#、//、/* */、docstring 引号及空白
+_COMMENT_MARKERS = " \t\r\n#/*\"'"
+
+# 无需交给大模型分析的注释（匹配去掉注释标记后的内容）；
+# 不开启 DOTALL，. 不跨行，多行注释中夹带的 URL 或许可证声明仍会被分析
+_TRIVIAL_COMMENT = re.compile(
+    r"""
+    [\W_]*                           # 空注释或分隔线：=====、-----、*****
+    | (?:https?://|www\.)\S+         # 只有一个 URL
+    | SPDX-License-Identifier:.*     # 单行的 SPDX 许可证声明
+    """,
+    re.VERBOSE,
+)
+
+# shebang：#! 后紧跟解释器路径，如 #!/usr/bin/env python
+_SHEBANG = re.compile(r"#!\s*/")
+
+
+def _is_trivial(comment: str, start_line: int = 0) -> bool:
+    """
+    判断注释是否无需分析（空注释、分隔线、shebang、URL、许可证声明）
+
+    Args:
+        comment: 注释原文
+        start_line: 注释起始行号（从 1 开始），只有文件首行才可能是 shebang
+
+    Returns:
+        是否跳过分析
+    """
+    if start_line == 1 and _SHEBANG.match(comment):
+        return True
+    # 不按字符数判断："# teh"、"# 中文" 这类短注释正是需要检查的对象
+    return _TRIVIAL_COMMENT.fullmatch(comment.strip(_COMMENT_MARKERS)) is not None
+
+
+def _format_context(context: dict[str, Any] | None, language: str) -> str:
+    """将注释所在最内层函数/类的代码格式化为提示词中的 Context，模块级注释为 None"""
+    if context is not None and "chain" in context:
+        context = context["chain"][-1]
+    if not context or "code" not in context:
+        return "None"
+    return f"```{language}\n{context['code']}\n```"
+
 
 class CoRex:
     """
@@ -34,39 +79,61 @@ class CoRex:
         """
         logger.info(f"Starting CoRex on file: {self.file_path}")
 
-        extraction_result = self.extractor.parse_file(self.file_path)
-        for comment_info in extraction_result:
-            filename = comment_info.get("file", "unknown")
-            comments_list = comment_info.get("comments", [])
-            logger.info(f"Extracted {len(comments_list)} comments from the {filename}.")
-            if not comments_list:
-                logger.warning(f"No comments found in file: {filename}")
-                continue
-            for comment_dic in comments_list:
-                comment = comment_dic.get("text", "")
-                if comment == "":
+        # 相同文本且相同上下文的注释（如许可证头）在整个运行中只分析一次，
+        # 结果复用到所有出现处
+        analyzed: dict[tuple[str, str], str] = {}
+        language = self.extractor.language
+
+        # 逐文件流式处理，解析与大模型请求交替进行，无需缓存整个仓库的注释
+        with open(self.save_path, "a", encoding="utf-8", buffering=1 << 16) as out:
+            for comment_info in self.extractor.iter_files(self.file_path):
+                filename = comment_info.get("file", "unknown")
+                comments_list = comment_info.get("comments", [])
+                logger.info(
+                    f"Extracted {len(comments_list)} comments from the {filename}."
+                )
+                if not comments_list:
+                    logger.warning(f"No comments found in file: {filename}")
                     continue
-                self.analyzer.comments = comment
-                response = self.analyzer.analyze()
-                if "Normal" not in response:
-                    with open(self.save_path, "a") as f:
-                        f.write(f"File:\n {filename}\n")
-                        f.write(f"Comment:\n{comment}\n")
-                        f.write(f"Analysis Result\n{response}\n")
-                        f.write("=" * 80 + "\n")
-                    logger.info(f"Analysis Result for {filename}:\n{response}")
-            # FIXME@haifeng: whether analyze all comments together in one file?
-            # total_comment = []
-            # for i, comment_dic in enumerate(comments_list):
-            #     comment = comment_dic.get("text", "")
-            #     total_comment.append(f"## Case{i}\n### Comment\ncomment:{comment}")
-            # all_comments = "\n".join(total_comment)
-            # logger.info(f"{all_comments}")
-            # self.analyzer.comments = all_comments
-            # response = self.analyzer.analyze()
-            # logger.info(f"Analysis completed for file: {filename}")
-            # logger.info(f"Analysis Result for {filename}:\n{response}")
-            # break
+                comments = [
+                    (comment, _format_context(comment_dic.get("context"), language))
+                    for comment_dic in comments_list
+                    if not _is_trivial(
+                        comment := comment_dic.get("text", ""),
+                        comment_dic.get("start_line", 0),
+                    )
+                ]
+                pending = [
+                    item for item in dict.fromkeys(comments) if item not in analyzed
+                ]
+                responses = self.analyzer.analyze_batch(
+                    [comment for comment, _ in pending],
+                    [context for _, context in pending],
+                )
+                analyzed.update(zip(pending, responses))
+                for comment, context in comments:
+                    response = analyzed[comment, context]
+                    if "Normal" not in response:
+                        out.write(
+                            f"File:\n {filename}\n"
+                            f"Comment:\n{comment}\n"
+                            f"Analysis Result\n{response}\n" + "=" * 80 + "\n"
+                        )
+                        logger.info(f"Analysis Result for {filename}:\n{response}")
+                # 每个文件处理完后落盘，中途退出也不丢失已有结果
+                out.flush()
+                # FIXME@haifeng: whether analyze all comments together in one file?
+                # total_comment = []
+                # for i, comment_dic in enumerate(comments_list):
+                #     comment = comment_dic.get("text", "")
+                #     total_comment.append(f"## Case{i}\n### Comment\ncomment:{comment}")
+                # all_comments = "\n".join(total_comment)
+                # logger.info(f"{all_comments}")
+                # self.analyzer.comments = all_comments
+                # response = self.analyzer.analyze()
+                # logger.info(f"Analysis completed for file: {filename}")
+                # logger.info(f"Analysis Result for {filename}:\n{response}")
+                # break
 
 
 def main(
@@ -74,6 +141,9 @@ def main(
         "/home/haifeng/data/pytorch/torchgen", help="Path to the folder/repo to scan."
     ),
     model_name: str = typer.Option("deepseek-chat", help="LLM model name."),
+    use_cache: bool = typer.Option(
+        False, help="Reuse cached LLM responses (replays earlier answers)."
+    ),
     language: str = typer.Option(
         "python", help="Programming language of the source code."
     ),
@@ -85,9 +155,11 @@ def main(
         "output.log", help="Path to save the analysis report."
     ),
 ):
-    llms = LLM(model_name=model_name)
+    llms = LLM(model_name=model_name, use_cache=use_cache)
     if extractor_type == "comment":
-        extractor = CommentExtractor(language=language)
+        extractor = CommentExtractor(
+            language=language, include_context=(analyze_type == "with_context")
+        )
     elif extractor_type == "keyword":  # TODO@haifeng
         extractor = KeywordExtractor(language=language)
     else:
@@ -103,7 +175,10 @@ def main(
     corex = CoRex(
         file_path=file_path, extractor=extractor, analyzer=analyzer, save_path=save_path
     )
-    corex.run()
+    try:
+        corex.run()
+    finally:
+        llms.close()
 
 
 # python -m corex.main --file-path /path/to/code --model-name deepseek-chat --language python --extractor-type comment --analyze-type without_context
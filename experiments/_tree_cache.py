@@ -0,0 +1,216 @@
+"""
+基于 SQLite 的解析结果缓存，以及按文件保留 Tree 的增量解析器。
+
+tree-sitter 的 Tree 无法序列化，因此缓存的是提取结果本身，
+以 (文件路径, 缓存键) 为主键，通过 mtime 快速判断、内容 sha256 兜底。
+缓存键应包含语言与提取器版本（见 code_version），避免复用其他配置下的结果。
+"""
+
+import hashlib
+import pickle
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+DEFAULT_DB_PATH = Path.home() / ".cache" / "corex" / "tree_cache.sqlite3"
+
+
+class TreeCache:
+    """解析结果缓存：内存 LRU + SQLite 持久化"""
+
+    def __init__(self, db_path: str | Path = DEFAULT_DB_PATH, mem_size: int = 10):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 进程池中的每个工作进程都会打开并写入同一个数据库：
+        # WAL 模式下读写互不阻塞，写锁冲突时最多等待 timeout 秒
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS t ("
+            "path TEXT, key TEXT, mtime_ns INTEGER, sha BLOB, blob BLOB, "
+            "PRIMARY KEY (path, key))"
+        )
+        self.mem: OrderedDict[tuple[str, str], tuple[int, bytes, Any]] = OrderedDict()
+        self.mem_size = mem_size
+
+    def get(self, file_path: str | Path, key: str = "") -> Any | None:
+        """
+        查询缓存
+
+        Args:
+            file_path: 文件路径
+            key: 缓存键（例如关键词），同一文件可以有多条结果
+
+        Returns:
+            缓存的提取结果，未命中或文件已修改时返回 None
+        """
+        file_path = Path(file_path)
+        mem_key = (str(file_path.resolve()), key)
+        entry = self.mem.get(mem_key)
+        if entry is None:
+            row = self.conn.execute(
+                "SELECT mtime_ns, sha, blob FROM t WHERE path = ? AND key = ?",
+                mem_key,
+            ).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], row[1], pickle.loads(row[2]))
+
+        mtime_ns, sha, result = entry
+        current_mtime_ns = file_path.stat().st_mtime_ns
+        if current_mtime_ns != mtime_ns:
+            # mtime 变化但内容未变（例如 touch、checkout）时仍然命中
+            if hashlib.sha256(file_path.read_bytes()).digest() != sha:
+                return None
+            entry = (current_mtime_ns, sha, result)
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE t SET mtime_ns = ? WHERE path = ? AND key = ?",
+                    (current_mtime_ns, *mem_key),
+                )
+
+        self._remember(mem_key, entry)
+        return result
+
+    def put(
+        self,
+        file_path: str | Path,
+        source_code: bytes,
+        result: Any,
+        key: str = "",
+        *,
+        mtime_ns: int,
+    ) -> None:
+        """
+        写入缓存
+
+        Args:
+            file_path: 文件路径
+            source_code: 文件内容
+            result: 提取结果
+            key: 缓存键
+            mtime_ns: 读取文件内容之前取得的 mtime；若在读取后再 stat，
+                文件在两者之间被修改时，新 mtime 会与旧内容的结果一起存入
+        """
+        file_path = Path(file_path)
+        mem_key = (str(file_path.resolve()), key)
+        sha = hashlib.sha256(source_code).digest()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO t (path, key, mtime_ns, sha, blob) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (*mem_key, mtime_ns, sha, pickle.dumps(result)),
+            )
+        self._remember(mem_key, (mtime_ns, sha, result))
+
+    def _remember(self, mem_key: tuple[str, str], entry: tuple[int, bytes, Any]):
+        """更新内存 LRU"""
+        self.mem[mem_key] = entry
+        self.mem.move_to_end(mem_key)
+        while len(self.mem) > self.mem_size:
+            self.mem.popitem(last=False)
+
+
+def code_version(*paths: str | Path) -> str:
+    """
+    根据提取器源码计算版本标记，作为缓存键的一部分
+
+    提取逻辑或结果格式一旦改动，旧的缓存结果便不再命中
+
+    Args:
+        paths: 提取器源文件路径
+
+    Returns:
+        源码内容的短 sha256
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def _common_prefix_length(a: bytes, b: bytes) -> int:
+    """二分查找公共前缀长度，每次比较都是 C 层的 memcmp"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_length(a: bytes, b: bytes, limit: int) -> int:
+    """二分查找公共后缀长度（不超过 limit）"""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid :] == b[len(b) - mid :]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _point(source: bytes, byte: int) -> tuple[int, int]:
+    """字节偏移 -> tree-sitter 的 (行, 字节列)"""
+    row = source.count(b"\n", 0, byte)
+    return row, byte - (source.rfind(b"\n", 0, byte) + 1)
+
+
+class IncrementalParser:
+    """
+    增量解析器：按文件路径保留上一次的 Tree
+
+    同一文件再次解析时，将新旧内容的差异区间通过 Tree.edit 告知 tree-sitter，
+    使其复用未修改的子树。
+    """
+
+    def __init__(self, parser, max_trees: int = 10):
+        self.parser = parser
+        self.trees: OrderedDict[str, tuple[bytes, Any]] = OrderedDict()
+        self.max_trees = max_trees
+
+    def parse(self, file_path: str | Path, source_code: bytes):
+        """
+        解析文件内容，若有旧 Tree 则增量解析
+
+        Args:
+            file_path: 文件路径
+            source_code: 文件内容
+
+        Returns:
+            tree-sitter Tree
+        """
+        key = str(Path(file_path).resolve())
+        previous = self.trees.get(key)
+        if previous is None:
+            tree = self.parser.parse(source_code)
+        elif previous[0] == source_code:
+            tree = previous[1]
+        else:
+            old_source, old_tree = previous
+            # 新旧内容之间只有一处差异区间：公共前缀之后、公共后缀之前
+            start = _common_prefix_length(old_source, source_code)
+            suffix = _common_suffix_length(
+                old_source, source_code, min(len(old_source), len(source_code)) - start
+            )
+            old_end = len(old_source) - suffix
+            new_end = len(source_code) - suffix
+            old_tree.edit(
+                start_byte=start,
+                old_end_byte=old_end,
+                new_end_byte=new_end,
+                start_point=_point(source_code, start),
+                old_end_point=_point(old_source, old_end),
+                new_end_point=_point(source_code, new_end),
+            )
+            tree = self.parser.parse(source_code, old_tree)
+
+        self.trees[key] = (source_code, tree)
+        self.trees.move_to_end(key)
+        while len(self.trees) > self.max_trees:
+            self.trees.popitem(last=False)
+        return tree
@@ -2,65 +2,201 @@
 使用 tree_sitter_languages 根据关键词提取代码片段及其上下文信息。
 """
 
-import json
+import mmap
+import os
+import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
-from tree_sitter_languages import get_parser
+import _tree_cache
+import orjson
+import tree_sitter_languages
+from _tree_cache import IncrementalParser, TreeCache, code_version
+from tree_sitter import Parser
+from tree_sitter_languages import get_language
+
+LANGUAGE = "python"
+
+CONTEXT_NODE_TYPES = ("function_definition", "class_definition")
+
+# 函数参数名：普通参数、带类型注解参数、带默认值参数
+PARAMETERS_QUERY = """
+(parameters (identifier) @parameter)
+(parameters (typed_parameter . (identifier) @parameter))
+(parameters (default_parameter name: (identifier) @parameter))
+"""
+
+# 语言库与查询在进程内只加载、编译一次，由所有提取器实例共享
+_LANGUAGE = get_language(LANGUAGE)
+_PARAMETERS_QUERY = _LANGUAGE.query(PARAMETERS_QUERY)
+
+# 缓存键前缀区分语言、语法库版本与提取器版本（含缓存模块自身）：
+# 升级 tree_sitter_languages 或修改提取代码后不会命中旧结果
+_CACHE_KEY_PREFIX = (
+    f"keywords:{LANGUAGE}:{tree_sitter_languages.__version__}:"
+    f"{code_version(__file__, _tree_cache.__file__)}:"
+)
+
+
+@contextmanager
+def _map_file(file_path: Path) -> Iterator[tuple[bytes | mmap.mmap, int]]:
+    """
+    只读映射文件内容，预筛选时无需把整个文件复制到内存
+
+    Args:
+        file_path: 文件路径
+
+    Yields:
+        (文件内容的只读映射, 映射前取得的 mtime_ns)，空文件无法映射时内容为 b""
+    """
+    with file_path.open("rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            yield b"", stat.st_mtime_ns
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source_map:
+            yield source_map, stat.st_mtime_ns
 
 
 class KeywordExtractor:
     """关键词提取器"""
 
-    def __init__(self):
-        self.parser = get_parser("python")
+    def __init__(self, cache: TreeCache | None = None):
+        # Parser 很轻量，每个实例一个，便于保留各自的增量解析状态
+        self.parser = Parser()
+        self.parser.set_language(_LANGUAGE)
+        self.parameters_query = _PARAMETERS_QUERY
+        self.cache = cache
+        self.incremental_parser = IncrementalParser(self.parser)
         self.source_code = b""
-        self.source_lines = []
+        self.line_starts = []
+        self._definition_cache: dict[int, dict[str, Any]] = {}
+        self._context_cache: dict[int, dict[str, Any]] = {}
         self.tree = None
 
-    def parse_file(self, file_path: str | Path, keyword: str) -> dict[str, Any]:
+    def parse_file(self, file_path: str | Path, keywords: list[str]) -> dict[str, Any]:
         """
         解析 Python 文件并根据关键词提取代码片段
 
         Args:
             file_path: Python 文件路径
-            keyword: 要搜索的关键词
+            keywords: 要搜索的关键词列表
 
         Returns:
             包含匹配信息的字典
         """
         file_path = Path(file_path)
-        self.source_code = file_path.read_bytes()
-        self.source_lines = self.source_code.decode("utf-8").split("\n")
+        with _map_file(file_path) as (source_code, mtime_ns):
+            return self.parse_file_from_bytes(
+                file_path, source_code, keywords, mtime_ns=mtime_ns
+            )
 
-        self.tree = self.parser.parse(self.source_code)
+    def parse_file_from_bytes(
+        self,
+        file_path: str | Path,
+        source_code: bytes | mmap.mmap,
+        keywords: list[str],
+        mtime_ns: int | None = None,
+    ) -> dict[str, Any]:
+        """
+        根据已读取的文件内容提取代码片段，避免重复读取文件
 
-        matches = []
-        self._search_keyword(keyword, matches)
+        Args:
+            file_path: Python 文件路径
+            source_code: 文件内容（bytes 或只读 mmap）
+            keywords: 要搜索的关键词列表
+            mtime_ns: 读取内容之前取得的文件 mtime；缺省时无法确认内容与文件
+                一致，只读缓存、不写缓存
 
-        return {
+        Returns:
+            包含匹配信息的字典
+        """
+        file_path = Path(file_path)
+        matches = []
+        result = {
             "file": str(file_path),
-            "keyword": keyword,
-            "total_matches": len(matches),
+            "keywords": list(keywords),
+            "total_matches": 0,
             "matches": matches,
         }
+        # 不含任何关键词的文件不可能有匹配，直接返回，也不读写缓存：
+        # 预筛选远比缓存的 sha256 与 SQLite 读写便宜；
+        # 注意 mmap 不支持 in 做子串判断，只能用 find
+        if all(source_code.find(keyword.encode("utf-8")) == -1 for keyword in keywords):
+            return result
+
+        if self.cache is not None:
+            cached = self.cache.get(file_path, self._cache_key(keywords))
+            if cached is not None:
+                return cached
+
+        # 解析、截取行与增量解析都需要 bytes，只有此时才复制文件内容
+        source_code = bytes(source_code)
+        self.source_code = source_code
+        self._definition_cache = {}
+        self._context_cache = {}
+        # 每行起始字节偏移，用于将匹配位置换算为行号、按需截取行
+        self.line_starts = [0] + [m.end() for m in re.finditer(b"\n", source_code)]
+        self.tree = self.incremental_parser.parse(file_path, source_code)
+        self._search_keywords(keywords, matches)
+        result["total_matches"] = len(matches)
+
+        # 只有通过了上面关键词预筛选的文件才会走到这里，
+        # 因此缓存里不会为大量不含关键词的文件写入空结果
+        if self.cache is not None and mtime_ns is not None:
+            self.cache.put(
+                file_path,
+                source_code,
+                result,
+                self._cache_key(keywords),
+                mtime_ns=mtime_ns,
+            )
+        return result
+
+    @staticmethod
+    def _cache_key(keywords: list[str]) -> str:
+        """缓存键：同一组关键词共享一条缓存记录"""
+        return _CACHE_KEY_PREFIX + "\0".join(keywords)
 
-    def _search_keyword(self, keyword: str, matches: list) -> None:
+    def _search_keywords(self, keywords: list[str], matches: list) -> None:
         """
-        搜索包含关键词的代码行
+        搜索包含关键词的代码行，一次解析服务所有关键词
 
         Args:
-            keyword: 搜索关键词
+            keywords: 搜索关键词列表
             matches: 匹配结果列表
         """
-        for line_num, line in enumerate(self.source_lines, start=1):
-            if keyword in line:
-                # 找到匹配的行，提取上下文信息
-                match_info = self._extract_match_info(line_num, line, keyword)
-                matches.append(match_info)
+        hits = []
+        for keyword in dict.fromkeys(keywords):
+            keyword_bytes = keyword.encode("utf-8")
+            if not keyword_bytes or b"\n" in keyword_bytes:
+                continue
+
+            # 在整个文件的字节流上查找，每行每个关键词只记录第一处匹配
+            pos = self.source_code.find(keyword_bytes)
+            while pos != -1:
+                hits.append((pos, keyword))
+                line_idx = bisect_right(self.line_starts, pos) - 1
+                if line_idx + 1 >= len(self.line_starts):
+                    break
+                pos = self.source_code.find(
+                    keyword_bytes, self.line_starts[line_idx + 1]
+                )
+
+        # 按出现位置排序，使多个关键词的匹配结果与源码顺序一致
+        hits.sort(key=lambda hit: hit[0])
+        for pos, keyword in hits:
+            line_idx = bisect_right(self.line_starts, pos) - 1
+            line = self._get_lines(line_idx + 1, line_idx + 1)
+            # 找到匹配的行，提取上下文信息
+            match_info = self._extract_match_info(line_idx + 1, line, keyword, pos)
+            matches.append(match_info)
 
     def _extract_match_info(
-        self, line_num: int, line: str, keyword: str
+        self, line_num: int, line: str, keyword: str, byte_offset: int
     ) -> dict[str, Any]:
         """
         提取匹配行的信息
@@ -69,6 +205,7 @@ class KeywordExtractor:
             line_num: 行号（从 1 开始）
             line: 行内容
             keyword: 关键词
+            byte_offset: 关键词在文件中的字节偏移
 
         Returns:
             匹配信息字典
@@ -76,11 +213,8 @@ class KeywordExtractor:
         # 计算关键词在行中的列位置
         col_start = line.find(keyword)
 
-        # tree-sitter 的行号从 0 开始
-        tree_line_num = line_num - 1
-
         # 在 tree-sitter 中查找该位置的节点
-        node = self._find_node_at_position(tree_line_num, col_start)
+        node = self._find_node_at_byte(byte_offset)
 
         # 查找所在的上下文（函数或类）
         context = self._find_context(node)
@@ -95,39 +229,18 @@ class KeywordExtractor:
             "context": context,
         }
 
-    def _find_node_at_position(self, line: int, column: int):
+    def _find_node_at_byte(self, offset: int):
         """
-        查找指定位置的 AST 节点
+        查找指定字节偏移处的 AST 节点
 
         Args:
-            line: 行号（从 0 开始）
-            column: 列号（从 0 开始）
+            offset: 字节偏移（从 0 开始）
 
         Returns:
             最小的包含该位置的节点
         """
-        root = self.tree.root_node
-
-        def find_smallest_node(node):
-            """递归查找最小的包含指定位置的节点"""
-            # 检查当前节点是否包含该位置
-            if not (
-                node.start_point[0] <= line <= node.end_point[0]
-                and (line != node.start_point[0] or column >= node.start_point[1])
-                and (line != node.end_point[0] or column <= node.end_point[1])
-            ):
-                return None
-
-            # 递归检查子节点
-            for child in node.children:
-                result = find_smallest_node(child)
-                if result is not None:
-                    return result
-
-            # 如果没有更小的子节点包含该位置，返回当前节点
-            return node
-
-        return find_smallest_node(root)
+        # 由 tree-sitter 在 C 中完成查找，无需在 Python 中递归遍历
+        return self.tree.root_node.descendant_for_byte_range(offset, offset)
 
     def _find_context(self, node) -> dict[str, Any]:
         """
@@ -142,27 +255,52 @@ class KeywordExtractor:
         if node is None:
             return {"type": "module", "name": None}
 
+        # 最内层的函数或类定义
         current = node
-        context_stack = []
+        while current is not None and current.type not in CONTEXT_NODE_TYPES:
+            current = current.parent
+
+        if current is None:
+            return {"type": "module", "name": None}
+
+        # 同一函数/类内的节点共享同一个上下文
+        if current.id in self._context_cache:
+            return self._context_cache[current.id]
 
+        leaf_id = current.id
+        context_stack = []
         while current is not None:
-            if current.type == "function_definition":
-                func_info = self._extract_function_info(current)
-                context_stack.append(func_info)
-            elif current.type == "class_definition":
-                class_info = self._extract_class_info(current)
-                context_stack.append(class_info)
+            if current.type in CONTEXT_NODE_TYPES:
+                context_stack.append(self._get_definition_info(current))
             current = current.parent
 
         # 反转堆栈，使得最外层的上下文在前
         context_stack.reverse()
 
-        if not context_stack:
-            return {"type": "module", "name": None}
-
-        return (
+        context = (
             context_stack[-1] if len(context_stack) == 1 else {"chain": context_stack}
         )
+        self._context_cache[leaf_id] = context
+        return context
+
+    def _get_definition_info(self, node) -> dict[str, Any]:
+        """
+        获取函数或类信息，每个定义节点只提取一次
+
+        Args:
+            node: function_definition 或 class_definition 节点
+
+        Returns:
+            函数或类信息字典
+        """
+        info = self._definition_cache.get(node.id)
+        if info is None:
+            if node.type == "function_definition":
+                info = self._extract_function_info(node)
+            else:
+                info = self._extract_class_info(node)
+            self._definition_cache[node.id] = info
+        return info
 
     def _extract_function_info(self, func_node) -> dict[str, Any]:
         """
@@ -174,20 +312,18 @@ class KeywordExtractor:
         Returns:
             函数信息字典
         """
-        func_name = None
-        params = []
-
-        for child in func_node.children:
-            if child.type == "identifier":
-                func_name = child.text.decode("utf-8")
-            elif child.type == "parameters":
-                params = self._extract_parameters(child)
+        name_node = func_node.child_by_field_name("name")
+        func_name = self._node_text(name_node) if name_node is not None else None
+        params_node = func_node.child_by_field_name("parameters")
+        params = (
+            self._extract_parameters(params_node) if params_node is not None else []
+        )
 
         start_line = func_node.start_point[0] + 1
         end_line = func_node.end_point[0] + 1
 
         # 提取函数代码
-        func_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        func_code = self._get_lines(start_line, end_line)
 
         return {
             "type": "function",
@@ -208,18 +344,14 @@ class KeywordExtractor:
         Returns:
             类信息字典
         """
-        class_name = None
-
-        for child in class_node.children:
-            if child.type == "identifier":
-                class_name = child.text.decode("utf-8")
-                break
+        name_node = class_node.child_by_field_name("name")
+        class_name = self._node_text(name_node) if name_node is not None else None
 
         start_line = class_node.start_point[0] + 1
         end_line = class_node.end_point[0] + 1
 
         # 提取类代码
-        class_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        class_code = self._get_lines(start_line, end_line)
 
         return {
             "type": "class",
@@ -229,6 +361,36 @@ class KeywordExtractor:
             "code": class_code,
         }
 
+    def _get_lines(self, start_line: int, end_line: int) -> str:
+        """
+        按行偏移索引截取源代码，只解码用到的部分
+
+        Args:
+            start_line: 起始行号（从 1 开始）
+            end_line: 结束行号（包含）
+
+        Returns:
+            对应行的源代码（不含末尾换行符）
+        """
+        start = self.line_starts[start_line - 1]
+        if end_line < len(self.line_starts):
+            end = self.line_starts[end_line] - 1
+        else:
+            end = len(self.source_code)
+        return self.source_code[start:end].decode("utf-8")
+
+    def _node_text(self, node) -> str:
+        """
+        按字节偏移从源代码中截取节点文本，省去 node.text 的额外拷贝
+
+        Args:
+            node: tree-sitter 节点
+
+        Returns:
+            节点文本
+        """
+        return self.source_code[node.start_byte : node.end_byte].decode("utf-8")
+
     def _extract_parameters(self, params_node) -> list[str]:
         """
         提取函数参数
@@ -239,21 +401,28 @@ class KeywordExtractor:
         Returns:
             参数列表
         """
-        params = []
-        for child in params_node.children:
-            if child.type == "identifier":
-                params.append(child.text.decode("utf-8"))
-            elif child.type == "typed_parameter":
-                for subchild in child.children:
-                    if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
-                        break
-            elif child.type == "default_parameter":
-                for subchild in child.children:
-                    if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
-                        break
-        return params
+        return [
+            self._node_text(node)
+            for node, _ in self.parameters_query.captures(params_node)
+        ]
+
+
+# 工作进程内的提取器，由进程池 initializer 创建
+_worker_extractor: KeywordExtractor | None = None
+_worker_keywords: list[str] = []
+
+
+def _init_worker(keywords: list[str]) -> None:
+    """进程池 initializer：每个工作进程创建一个提取器"""
+    global _worker_extractor, _worker_keywords
+    _worker_extractor = KeywordExtractor(cache=TreeCache())
+    _worker_keywords = keywords
+
+
+def _parse_one(py_file: Path) -> dict[str, Any]:
+    """进程池工作函数：解析单个文件"""
+    assert _worker_extractor is not None
+    return _worker_extractor.parse_file(py_file, _worker_keywords)
 
 
 def main():
@@ -265,10 +434,7 @@ def main():
     dataset_dir = Path("/home/haifeng/data/pytorch/torch")
 
     # 设置关键词（可以从命令行参数获取）
-    keyword = "a * b" if len(sys.argv) < 2 else sys.argv[1]
-
-    # 创建提取器
-    extractor = KeywordExtractor()
+    keywords = sys.argv[1:] or ["a * b"]
 
     # 查找所有 Python 文件
     py_files = list(dataset_dir.glob("*.py"))
@@ -277,80 +443,86 @@ def main():
         print(f"在 {dataset_dir} 中未找到 Python 文件")
         return
 
-    print(f"搜索关键词: '{keyword}'")
+    print(f"搜索关键词: {', '.join(repr(k) for k in keywords)}")
     print(f"找到 {len(py_files)} 个 Python 文件")
     print("=" * 80)
 
     all_results = []
 
-    for py_file in py_files:
-        result = extractor.parse_file(py_file, keyword)
-        from pprint import pprint
-
-        pprint(
-            result,
-            indent=4,  # 缩进空格数
-            depth=6,  # 只显示到第几层
-            sort_dicts=False,  # 是否按键排序
-        )
-        break
-        print()
-        if result["total_matches"] > 0:
-            print(f"\n文件: {py_file.name}")
-            print("-" * 80)
-            print(f"找到 {result['total_matches']} 处匹配\n")
-
-            for i, match in enumerate(result["matches"], 1):
-                print(f"[{i}] 第 {match['start_line']} 行，列 {match['column_start']}")
-                print(f"    代码: {match['text']}")
-
-                # 显示上下文信息
-                context = match["context"]
-
-                if "chain" in context:
-                    # 多层嵌套
-                    chain_info = " -> ".join(
-                        [f"{c['type']}:{c['name']}" for c in context["chain"]]
-                    )
-                    print(f"    上下文: {chain_info}")
-                    # 显示最内层函数/类的信息
-                    innermost = context["chain"][-1]
-                    print(f"    所在{innermost['type']}: {innermost['name']}")
-                    print(
-                        f"    {innermost['type']}范围: {innermost['start_line']}-{innermost['end_line']} 行"
-                    )
-                    print(f"    参数: {innermost.get('parameters', 'N/A')}")
-                    print(f"\n    完整{innermost['type']}代码:")
-                    for line in innermost["code"].split("\n"):
-                        print(f"      {line}")
-                elif context["type"] in ("function", "class"):
-                    print(f"    上下文: {context['type']}:{context['name']}")
+    # 按文件分发到多进程并行解析，结果按原顺序在主进程中输出
+    with ProcessPoolExecutor(
+        initializer=_init_worker, initargs=(keywords,)
+    ) as executor:
+        for py_file, result in zip(py_files, executor.map(_parse_one, py_files)):
+            from pprint import pprint
+
+            pprint(
+                result,
+                indent=4,  # 缩进空格数
+                depth=6,  # 只显示到第几层
+                sort_dicts=False,  # 是否按键排序
+            )
+            break
+            print()
+            if result["total_matches"] > 0:
+                print(f"\n文件: {py_file.name}")
+                print("-" * 80)
+                print(f"找到 {result['total_matches']} 处匹配\n")
+
+                for i, match in enumerate(result["matches"], 1):
                     print(
-                        f"    {context['type']}范围: {context['start_line']}-{context['end_line']} 行"
+                        f"[{i}] 第 {match['start_line']} 行，列 {match['column_start']}"
                     )
-                    print(f"    参数: {context.get('parameters', 'N/A')}")
-                    print(f"\n    完整{context['type']}代码:")
-                    for line in context["code"].split("\n"):
-                        print(f"      {line}")
-                else:
-                    print("    上下文: 模块级别")
-
-                print()
-
-            # 保存到 JSON 文件
-            output_file = (
-                root
-                / f"{py_file.stem}_keyword_{keyword.replace(' ', '_').replace('*', 'star')}.json"
-            )
-            with output_file.open("w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            print(f"结果已保存到: {output_file}")
-            print("=" * 80)
-
-            all_results.append(result)
+                    print(f"    代码: {match['text']}")
+
+                    # 显示上下文信息
+                    context = match["context"]
+
+                    if "chain" in context:
+                        # 多层嵌套
+                        chain_info = " -> ".join(
+                            [f"{c['type']}:{c['name']}" for c in context["chain"]]
+                        )
+                        print(f"    上下文: {chain_info}")
+                        # 显示最内层函数/类的信息
+                        innermost = context["chain"][-1]
+                        print(f"    所在{innermost['type']}: {innermost['name']}")
+                        print(
+                            f"    {innermost['type']}范围: {innermost['start_line']}-{innermost['end_line']} 行"
+                        )
+                        print(f"    参数: {innermost.get('parameters', 'N/A')}")
+                        print(f"\n    完整{innermost['type']}代码:")
+                        for line in innermost["code"].split("\n"):
+                            print(f"      {line}")
+                    elif context["type"] in ("function", "class"):
+                        print(f"    上下文: {context['type']}:{context['name']}")
+                        print(
+                            f"    {context['type']}范围: {context['start_line']}-{context['end_line']} 行"
+                        )
+                        print(f"    参数: {context.get('parameters', 'N/A')}")
+                        print(f"\n    完整{context['type']}代码:")
+                        for line in context["code"].split("\n"):
+                            print(f"      {line}")
+                    else:
+                        print("    上下文: 模块级别")
+
+                    print()
+
+                # 保存到 JSON 文件
+                output_file = (
+                    root
+                    / f"{py_file.stem}_keyword_{'+'.join(keywords).replace(' ', '_').replace('*', 'star')}.json"
+                )
+                output_file.write_bytes(
+                    orjson.dumps(result, option=orjson.OPT_INDENT_2)
+                )
+                print(f"结果已保存到: {output_file}")
+                print("=" * 80)
+
+                all_results.append(result)
 
     if not all_results:
-        print(f"\n未找到包含关键词 '{keyword}' 的代码")
+        print(f"\n未找到包含关键词 {', '.join(repr(k) for k in keywords)} 的代码")
 
 
 if __name__ == "__main__":
@@ -3,20 +3,78 @@
 包括注释所在的行数和函数上下文。
 """
 
-import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any
 
-from tree_sitter_languages import get_parser
+import _tree_cache
+import orjson
+import tree_sitter_languages
+from _tree_cache import IncrementalParser, TreeCache, code_version
+from tree_sitter import Parser
+from tree_sitter_languages import get_language
+
+CONTEXT_NODE_TYPES = ("function_definition", "class_definition")
+
+LANGUAGE = "cpp"
+
+COMMENT_QUERY = "(comment) @comment"
+
+# docstring：模块、类或函数的第一条语句（可以有注释在前）为字符串字面量
+DOCSTRING_QUERY = {
+    "python": """
+    (module . (comment)* . (expression_statement . (string) @docstring))
+    (function_definition
+      body: (block . (comment)* . (expression_statement . (string) @docstring)))
+    (class_definition
+      body: (block . (comment)* . (expression_statement . (string) @docstring)))
+    """,
+}
+
+# 函数参数名：普通参数、带类型注解参数、带默认值参数
+PARAMETERS_QUERY = {
+    "python": """
+    (parameters (identifier) @parameter)
+    (parameters (typed_parameter . (identifier) @parameter))
+    (parameters (default_parameter name: (identifier) @parameter))
+    """,
+}
+
+# 语言库与查询在进程内只加载、编译一次，由所有提取器实例共享
+_LANGUAGE = get_language(LANGUAGE)
+_QUERY = _LANGUAGE.query(COMMENT_QUERY + DOCSTRING_QUERY.get(LANGUAGE, ""))
+# 只有 Python 语法树中存在 parameters 节点
+_PARAMETERS_QUERY = (
+    _LANGUAGE.query(PARAMETERS_QUERY[LANGUAGE])
+    if LANGUAGE in PARAMETERS_QUERY
+    else None
+)
+
+# 缓存键区分语言、语法库版本与提取器版本（含缓存模块自身）：
+# 切换 LANGUAGE、升级 tree_sitter_languages 或修改提取代码后不会命中旧结果
+_CACHE_KEY = (
+    f"comments:{LANGUAGE}:{tree_sitter_languages.__version__}:"
+    f"{code_version(__file__, _tree_cache.__file__)}"
+)
 
 
 class PythonCommentExtractor:
     """Python 注释提取器"""
 
-    def __init__(self):
-        self.parser = get_parser("cpp")
+    def __init__(self, cache: TreeCache | None = None):
+        # Parser 很轻量，每个实例一个，便于保留各自的增量解析状态
+        self.parser = Parser()
+        self.parser.set_language(_LANGUAGE)
+        self.query = _QUERY
+        self.parameters_query = _PARAMETERS_QUERY
+        self.cache = cache
+        self.incremental_parser = IncrementalParser(self.parser)
         self.source_code = b""
-        self.source_lines = []
+        self.line_starts = []
+        self._definition_cache: dict[int, dict[str, Any]] = {}
+        self._context_cache: dict[int, dict[str, Any]] = {}
 
     def parse_file(self, file_path: str | Path) -> dict[str, Any]:
         """
@@ -29,80 +87,50 @@ class PythonCommentExtractor:
             包含注释信息的字典
         """
         file_path = Path(file_path)
-        self.source_code = file_path.read_bytes()
-        self.source_lines = self.source_code.decode("utf-8").split("\n")
-
-        tree = self.parser.parse(self.source_code)
+        if self.cache is not None:
+            cached = self.cache.get(file_path, _CACHE_KEY)
+            if cached is not None:
+                return cached
+
+        # 先取 mtime 再读取内容，写入缓存的 mtime 不会比内容更新
+        with file_path.open("rb") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            self.source_code = f.read()
+        self._definition_cache = {}
+        self._context_cache = {}
+        # 每行起始字节偏移，用于按需截取函数/类代码
+        self.line_starts = [0] + [m.end() for m in re.finditer(b"\n", self.source_code)]
+
+        tree = self.incremental_parser.parse(file_path, self.source_code)
         root_node = tree.root_node
 
         comments = []
         self._extract_comments(root_node, comments)
 
-        return {
+        result = {
             "file": str(file_path),
             "total_comments": len(comments),
             "comments": comments,
         }
+        if self.cache is not None:
+            self.cache.put(
+                file_path, self.source_code, result, _CACHE_KEY, mtime_ns=mtime_ns
+            )
+        return result
 
-    def _extract_comments(self, node, comments: list) -> None:
+    def _extract_comments(self, root_node, comments: list) -> None:
         """
-        递归提取所有注释节点
+        通过 tree-sitter Query 一次性匹配所有注释与 docstring 节点
 
         Args:
-            node: tree-sitter 节点
+            root_node: tree-sitter 根节点
             comments: 注释列表
         """
-        # 提取 # 注释
-        if node.type == "comment":
-            comment_info = self._extract_comment_info(node)
-            comments.append(comment_info)
-
-        # 提取 docstring（字符串字面量作为表达式语句）
-        elif node.type == "expression_statement":
-            if node.children and node.children[0].type == "string":
-                string_node = node.children[0]
-                # 判断是否为 docstring
-                if self._is_docstring(node):
-                    comment_info = self._extract_docstring_info(string_node, node)
-                    comments.append(comment_info)
-
-        # 递归处理子节点
-        for child in node.children:
-            self._extract_comments(child, comments)
-
-    def _is_docstring(self, expr_stmt_node) -> bool:
-        """
-        判断表达式语句是否为 docstring
-
-        Docstring 通常是模块、类或函数的第一条语句
-        """
-        parent = expr_stmt_node.parent
-        if parent is None:
-            return False
-
-        # 模块级 docstring
-        if parent.type == "module":
-            # 检查是否为第一个非注释子节点
-            for child in parent.children:
-                if child.type == "comment":
-                    continue
-                return child == expr_stmt_node
-
-        # 函数或类的 docstring
-        # 结构: function_definition/class_definition -> block -> expression_statement
-        if parent.type == "block":
-            # 检查 block 的父节点是否为函数或类定义
-            grandparent = parent.parent
-            if grandparent and grandparent.type in (
-                "function_definition",
-                "class_definition",
-            ):
-                # 检查是否为 block 的第一个非注释子节点
-                for child in parent.children:
-                    if child.type == "comment":
-                        continue
-                    return child == expr_stmt_node
-        return False
+        for node, capture_name in self.query.captures(root_node):
+            if capture_name == "comment":
+                comments.append(self._extract_comment_info(node))
+            else:
+                comments.append(self._extract_docstring_info(node, node.parent))
 
     def _extract_comment_info(self, node) -> dict[str, Any]:
         """
@@ -116,7 +144,7 @@ class PythonCommentExtractor:
         """
         start_line = node.start_point[0] + 1  # tree-sitter 行号从 0 开始
         end_line = node.end_point[0] + 1
-        comment_text = node.text.decode("utf-8")
+        comment_text = self._node_text(node)
 
         # 查找所在的函数或类
         context = self._find_context(node)
@@ -142,7 +170,7 @@ class PythonCommentExtractor:
         """
         start_line = string_node.start_point[0] + 1
         end_line = string_node.end_point[0] + 1
-        docstring_text = string_node.text.decode("utf-8")
+        docstring_text = self._node_text(string_node)
 
         # 查找所在的函数或类
         context = self._find_context(expr_stmt_node)
@@ -165,27 +193,52 @@ class PythonCommentExtractor:
         Returns:
             上下文信息字典
         """
+        # 最内层的函数或类定义
         current = node.parent
-        context_stack = []
+        while current is not None and current.type not in CONTEXT_NODE_TYPES:
+            current = current.parent
+
+        if current is None:
+            return {"type": "module", "name": None}
 
+        # 同一函数/类内的节点共享同一个上下文
+        if current.id in self._context_cache:
+            return self._context_cache[current.id]
+
+        leaf_id = current.id
+        context_stack = []
         while current is not None:
-            if current.type == "function_definition":
-                func_info = self._extract_function_info(current)
-                context_stack.append(func_info)
-            elif current.type == "class_definition":
-                class_info = self._extract_class_info(current)
-                context_stack.append(class_info)
+            if current.type in CONTEXT_NODE_TYPES:
+                context_stack.append(self._get_definition_info(current))
             current = current.parent
 
         # 反转堆栈，使得最外层的上下文在前
         context_stack.reverse()
 
-        if not context_stack:
-            return {"type": "module", "name": None}
-
-        return (
+        context = (
             context_stack[-1] if len(context_stack) == 1 else {"chain": context_stack}
         )
+        self._context_cache[leaf_id] = context
+        return context
+
+    def _get_definition_info(self, node) -> dict[str, Any]:
+        """
+        获取函数或类信息，每个定义节点只提取一次
+
+        Args:
+            node: function_definition 或 class_definition 节点
+
+        Returns:
+            函数或类信息字典
+        """
+        info = self._definition_cache.get(node.id)
+        if info is None:
+            if node.type == "function_definition":
+                info = self._extract_function_info(node)
+            else:
+                info = self._extract_class_info(node)
+            self._definition_cache[node.id] = info
+        return info
 
     def _extract_function_info(self, func_node) -> dict[str, Any]:
         """
@@ -197,20 +250,18 @@ class PythonCommentExtractor:
         Returns:
             函数信息字典
         """
-        func_name = None
-        params = []
-
-        for child in func_node.children:
-            if child.type == "identifier":
-                func_name = child.text.decode("utf-8")
-            elif child.type == "parameters":
-                params = self._extract_parameters(child)
+        name_node = func_node.child_by_field_name("name")
+        func_name = self._node_text(name_node) if name_node is not None else None
+        params_node = func_node.child_by_field_name("parameters")
+        params = (
+            self._extract_parameters(params_node) if params_node is not None else []
+        )
 
         start_line = func_node.start_point[0] + 1
         end_line = func_node.end_point[0] + 1
 
         # 提取函数代码
-        func_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        func_code = self._get_lines(start_line, end_line)
 
         return {
             "type": "function",
@@ -231,18 +282,14 @@ class PythonCommentExtractor:
         Returns:
             类信息字典
         """
-        class_name = None
-
-        for child in class_node.children:
-            if child.type == "identifier":
-                class_name = child.text.decode("utf-8")
-                break
+        name_node = class_node.child_by_field_name("name")
+        class_name = self._node_text(name_node) if name_node is not None else None
 
         start_line = class_node.start_point[0] + 1
         end_line = class_node.end_point[0] + 1
 
         # 提取类代码
-        class_code = "\n".join(self.source_lines[start_line - 1 : end_line])
+        class_code = self._get_lines(start_line, end_line)
 
         return {
             "type": "class",
@@ -252,6 +299,36 @@ class PythonCommentExtractor:
             "code": class_code,
         }
 
+    def _get_lines(self, start_line: int, end_line: int) -> str:
+        """
+        按行偏移索引截取源代码，只解码用到的部分
+
+        Args:
+            start_line: 起始行号（从 1 开始）
+            end_line: 结束行号（包含）
+
+        Returns:
+            对应行的源代码（不含末尾换行符）
+        """
+        start = self.line_starts[start_line - 1]
+        if end_line < len(self.line_starts):
+            end = self.line_starts[end_line] - 1
+        else:
+            end = len(self.source_code)
+        return self.source_code[start:end].decode("utf-8")
+
+    def _node_text(self, node) -> str:
+        """
+        按字节偏移从源代码中截取节点文本，省去 node.text 的额外拷贝
+
+        Args:
+            node: tree-sitter 节点
+
+        Returns:
+            节点文本
+        """
+        return self.source_code[node.start_byte : node.end_byte].decode("utf-8")
+
     def _extract_parameters(self, params_node) -> list[str]:
         """
         提取函数参数
@@ -262,21 +339,26 @@ class PythonCommentExtractor:
         Returns:
             参数列表
         """
-        params = []
-        for child in params_node.children:
-            if child.type == "identifier":
-                params.append(child.text.decode("utf-8"))
-            elif child.type == "typed_parameter":
-                for subchild in child.children:
-                    if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
-                        break
-            elif child.type == "default_parameter":
-                for subchild in child.children:
-                    if subchild.type == "identifier":
-                        params.append(subchild.text.decode("utf-8"))
-                        break
-        return params
+        return [
+            self._node_text(node)
+            for node, _ in self.parameters_query.captures(params_node)
+        ]
+
+
+# 工作进程内的提取器，由进程池 initializer 创建
+_worker_extractor: PythonCommentExtractor | None = None
+
+
+def _init_worker() -> None:
+    """进程池 initializer：每个工作进程创建一个提取器"""
+    global _worker_extractor
+    _worker_extractor = PythonCommentExtractor(cache=TreeCache())
+
+
+def _parse_one(py_file: Path) -> dict[str, Any]:
+    """进程池工作函数：解析单个文件"""
+    assert _worker_extractor is not None
+    return _worker_extractor.parse_file(py_file)
 
 
 def main():
@@ -285,9 +367,6 @@ def main():
     root = Path(__file__).parent
     dataset_dir = root / "datasets"
 
-    # 创建提取器
-    extractor = PythonCommentExtractor()
-
     # 查找所有 C++ 文件
     py_files = list(dataset_dir.glob("*.cpp"))
 
@@ -298,62 +377,62 @@ def main():
     print(f"找到 {len(py_files)} 个 Python 文件")
     print("=" * 80)
 
-    for py_file in py_files:
-        print(f"\n处理文件: {py_file.name}")
-        print("-" * 80)
-
-        result = extractor.parse_file(py_file)
-        from pprint import pprint
-
-        pprint(
-            result,
-            indent=4,  # 缩进空格数
-            depth=5,  # 只显示到第几层
-            sort_dicts=False,  # 是否按键排序
-        )
-        print(f"总注释数: {result['total_comments']}\n")
-
-        for i, comment in enumerate(result["comments"], 1):
-            print(f"[{i}] {comment['type'].upper()}")
-            print(f"    行号: {comment['start_line']}-{comment['end_line']}")
-            print(f"    文本: {comment['text'][:100]}...")  # 限制显示长度
-
-            # 显示上下文信息
-            context = comment["context"]
-
-            if "chain" in context:
-                # 多层嵌套
-                chain_info = " -> ".join(
-                    [f"{c['type']}:{c['name']}" for c in context["chain"]]
-                )
-                print(f"    上下文: {chain_info}")
-                # 显示最内层函数的代码
-                innermost = context["chain"][-1]
-                print(
-                    f"    所在{innermost['type']}代码 ({innermost['start_line']}-{innermost['end_line']}):"
-                )
-                print(
-                    "    " + "\n    ".join(innermost["code"].split("\n")[:5])
-                )  # 显示前5行
-            elif context["type"] in ("function", "class"):
-                print(f"    上下文: {context['type']}:{context['name']}")
-                print(
-                    f"    所在{context['type']}代码 ({context['start_line']}-{context['end_line']}):"
-                )
-                print(
-                    "    " + "\n    ".join(context["code"].split("\n")[:5])
-                )  # 显示前5行
-            else:
-                print(f"    上下文: {context['type']}")
-
-            print()
-
-        # 保存到 JSON 文件
-        output_file = root / f"{py_file.stem}_comments.json"
-        with output_file.open("w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-        print(f"\n结果已保存到: {output_file}")
-        print("=" * 80)
+    # 按文件分发到多进程并行解析，结果按原顺序在主进程中输出
+    with ProcessPoolExecutor(initializer=_init_worker) as executor:
+        for py_file, result in zip(py_files, executor.map(_parse_one, py_files)):
+            print(f"\n处理文件: {py_file.name}")
+            print("-" * 80)
+
+            from pprint import pprint
+
+            pprint(
+                result,
+                indent=4,  # 缩进空格数
+                depth=5,  # 只显示到第几层
+                sort_dicts=False,  # 是否按键排序
+            )
+            print(f"总注释数: {result['total_comments']}\n")
+
+            for i, comment in enumerate(result["comments"], 1):
+                print(f"[{i}] {comment['type'].upper()}")
+                print(f"    行号: {comment['start_line']}-{comment['end_line']}")
+                print(f"    文本: {comment['text'][:100]}...")  # 限制显示长度
+
+                # 显示上下文信息
+                context = comment["context"]
+
+                if "chain" in context:
+                    # 多层嵌套
+                    chain_info = " -> ".join(
+                        [f"{c['type']}:{c['name']}" for c in context["chain"]]
+                    )
+                    print(f"    上下文: {chain_info}")
+                    # 显示最内层函数的代码
+                    innermost = context["chain"][-1]
+                    print(
+                        f"    所在{innermost['type']}代码 ({innermost['start_line']}-{innermost['end_line']}):"
+                    )
+                    print(
+                        "    " + "\n    ".join(innermost["code"].split("\n", 5)[:5])
+                    )  # 显示前5行
+                elif context["type"] in ("function", "class"):
+                    print(f"    上下文: {context['type']}:{context['name']}")
+                    print(
+                        f"    所在{context['type']}代码 ({context['start_line']}-{context['end_line']}):"
+                    )
+                    print(
+                        "    " + "\n    ".join(context["code"].split("\n", 5)[:5])
+                    )  # 显示前5行
+                else:
+                    print(f"    上下文: {context['type']}")
+
+                print()
+
+            # 保存到 JSON 文件
+            output_file = root / f"{py_file.stem}_comments.json"
+            output_file.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
+            print(f"\n结果已保存到: {output_file}")
+            print("=" * 80)
 
 
 if __name__ == "__main__":
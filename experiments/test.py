@@ -28,17 +28,22 @@ tree = parser.parse(code)
 root = tree.root_node
 
 
-# 构建 rich 树
-def build_tree(node, code):
-    # 节点文本（取代码片段）
+# 片段最多显示的字符数
+SNIPPET_CHARS = 60
+
+
+def build_label(node, code):
+    # 节点文本（取代码片段），UTF-8 每个字符至多 4 字节，
+    # 只解码足以判断是否超长的前缀，避免对大节点解码整个子树
+    end = min(node.end_byte, node.start_byte + (SNIPPET_CHARS + 1) * 4)
     snippet = (
-        code[node.start_byte : node.end_byte]
-        .decode("utf-8")
+        code[node.start_byte : end]
+        .decode("utf-8", errors="replace")
         .strip()
         .replace("\n", "⏎ ")
     )
-    if len(snippet) > 60:
-        snippet = snippet[:60] + "..."
+    if len(snippet) > SNIPPET_CHARS:
+        snippet = snippet[:SNIPPET_CHARS] + "..."
 
     # 富文本显示
     label = Text()
@@ -48,11 +53,24 @@ def build_tree(node, code):
         style="dim",
     )
     label.append(f"  “{snippet}”", style="green")
+    return label
 
-    rich_node = Tree(label)
-    for child in node.children:
-        rich_node.add(build_tree(child, code))
-    return rich_node
+
+# 构建 rich 树：用 TreeCursor 迭代遍历，栈顶始终对应游标所在节点
+def build_tree(node, code):
+    cursor = node.walk()
+    stack = [Tree(build_label(node, code))]
+    while True:
+        if cursor.goto_first_child():
+            stack.append(stack[-1].add(build_label(cursor.node, code)))
+            continue
+        # 没有子节点时转到下一个兄弟节点，没有兄弟则回溯到父节点
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return stack[0]
+            stack.pop()
+        stack.pop()
+        stack.append(stack[-1].add(build_label(cursor.node, code)))
 
 
 if __name__ == "__main__":